@@ -0,0 +1,172 @@
+# Header will go here when ready to publish
+"""
+Resolution of S3 bucket regions shared by the AWSH S3 tools. Bucket regions
+practically never change so they are kept in a persistent cache and only
+looked up again when a bucket is new or S3 redirects a request for it
+"""
+
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from awshutils.logger import LOG_CONTEXT
+from awshutils.aws.cache import SnapshotStore, CONST_CACHE_ROOT
+
+###############################################################################
+# CONFIG - Begin
+###############################################################################
+
+# Number of GetBucketLocation calls allowed to run at the same time
+CONST_BUCKET_REGION_MAX_WORKERS = int(os.getenv('AWSH_BUCKET_REGION_MAX_WORKERS', 16))
+
+# Bucket regions are global to an account so they are stored under this
+# pseudo region in the snapshot store
+CONST_BUCKET_REGION_SCOPE = 'global'
+
+# Legacy LocationConstraint values returned by GetBucketLocation
+CONST_LEGACY_LOCATIONS = {
+    None: 'us-east-1',
+    '': 'us-east-1',
+    'EU': 'eu-west-1',
+}
+
+###############################################################################
+# CONFIG - End (Do Not Edit Below)
+###############################################################################
+
+_log = logging.getLogger(LOG_CONTEXT)
+
+###############################################################################
+# Classes
+###############################################################################
+
+
+class BucketRegionCache():
+    '''Persistent map of bucket name to region for an account
+    eg.
+        cache = BucketRegionCache()
+        cache.resolve(s3_client, ['logs', 'assets'])  --> {'logs': 'eu-west-1', 'assets': 'us-east-1'}
+        cache.redirected('assets', error)             --> 'eu-central-1'
+    '''
+
+    def __init__(self, account_id=None, root=CONST_CACHE_ROOT):
+        self.store = SnapshotStore(
+            's3',
+            account_id or os.getenv('AWS_ACCOUNT_NUMBER', 'default'),
+            CONST_BUCKET_REGION_SCOPE,
+            ttl=-1,
+            root=root
+        )
+        self.regions = self.store.load('bucket-regions') or {}
+        self._changed = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.regions)
+
+    def get(self, bucket):
+        '''Returns the cached region of a bucket or None if not known'''
+        return self.regions.get(bucket)
+
+    def set(self, bucket, region):
+        with self._lock:
+            if self.regions.get(bucket) != region:
+                self.regions[bucket] = region
+                self._changed = True
+
+    def discard(self, bucket):
+        with self._lock:
+            if self.regions.pop(bucket, None) is not None:
+                self._changed = True
+
+    def save(self):
+        '''Persists the cache if anything was resolved since it was loaded'''
+
+        with self._lock:
+            if self._changed:
+                self.store.save('bucket-regions', self.regions)
+                self._changed = False
+
+    def resolve(self, client, buckets, refresh=False, max_workers=CONST_BUCKET_REGION_MAX_WORKERS):
+        '''Returns {bucket: region} for a list of buckets, looking up only the
+        buckets missing from the cache on a thread pool sharing one client.
+        Buckets whose region cannot be determined map to None'''
+
+        missing = [b for b in buckets if refresh or b not in self.regions]
+        if missing:
+            start = time.time()
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(missing)))) as pool:
+                for bucket, region in zip(missing, pool.map(lambda b: get_bucket_region(client, b), missing)):
+                    if region is not None:
+                        self.set(bucket, region)
+            _log.debug('Resolved {0} of {1} bucket regions in {2:.3f}s'.format(len(missing), len(buckets), time.time() - start))
+            self.save()
+
+        return {b: self.regions.get(b) for b in buckets}
+
+    def redirected(self, bucket, error, client=None):
+        '''Updates the region of a bucket after S3 answered a request for it
+        with a redirect. Returns the new region, or None if the error was not
+        a redirect or the region could not be determined'''
+
+        if not is_redirect(error):
+            return None
+
+        region = redirect_region(error)
+        if region is None and client is not None:
+            region = get_bucket_region(client, bucket)
+
+        if region is None:
+            self.discard(bucket)
+        else:
+            _log.debug('Bucket {0} moved to {1}'.format(bucket, region))
+            self.set(bucket, region)
+        self.save()
+        return region
+
+
+###############################################################################
+# Functions
+###############################################################################
+
+
+def location_to_region(location):
+    '''Converts a GetBucketLocation LocationConstraint to a region name'''
+    return CONST_LEGACY_LOCATIONS.get(location, location)
+
+
+def get_bucket_region(client, bucket):
+    '''Looks up the region of a single bucket, returning None on failure'''
+
+    try:
+        response = client.get_bucket_location(Bucket=bucket)
+    except ClientError as e:
+        region = redirect_region(e)
+        if region is None:
+            _log.warning('Unable to determine region of bucket {0}: {1}'.format(bucket, e))
+        return region
+
+    return location_to_region(response.get('LocationConstraint'))
+
+
+def is_redirect(error):
+    '''Returns True if a ClientError is S3 redirecting to another region'''
+
+    try:
+        return (
+            error.response['Error'].get('Code') in ['PermanentRedirect', '301']
+            or error.response['ResponseMetadata'].get('HTTPStatusCode') == 301
+        )
+    except (AttributeError, KeyError, TypeError):
+        return False
+
+
+def redirect_region(error):
+    '''Returns the bucket region S3 reports in a redirect, if any'''
+
+    try:
+        return error.response['ResponseMetadata']['HTTPHeaders'].get('x-amz-bucket-region')
+    except (AttributeError, KeyError, TypeError):
+        return None
@@ -0,0 +1,163 @@
+# Header will go here when ready to publish
+"""
+Persistent on-disk snapshot store used by AWSH tools to keep lookup data
+between invocations instead of re-describing a whole region each time
+"""
+
+import os
+import json
+import time
+import errno
+import tempfile
+import logging
+from awshutils.logger import LOG_CONTEXT
+
+###############################################################################
+# CONFIG - Begin
+###############################################################################
+
+CONST_CACHE_ROOT = os.getenv(
+    'AWSH_CACHE_ROOT',
+    os.path.join(os.getenv('HOME', '/tmp'), '.awsh', 'cache')
+)
+CONST_CACHE_DEFAULT_TTL = int(os.getenv('AWSH_CACHE_TTL', 300))
+CONST_CACHE_FORMAT_VERSION = 1
+
+###############################################################################
+# CONFIG - End (Do Not Edit Below)
+###############################################################################
+
+_log = logging.getLogger(LOG_CONTEXT)
+
+###############################################################################
+# Classes
+###############################################################################
+
+
+class SnapshotStore():
+    '''Helper class for persisting JSON snapshots keyed by account id, region
+    and resource type
+    eg.
+        ~/.awsh/cache/mapper/123456789012/eu-west-1/vpc.json
+
+    Writes go to a temporary file in the same directory which is then renamed
+    over the snapshot so concurrent readers only ever see a complete file.
+    '''
+
+    def __init__(self, namespace, account_id, region, ttl=CONST_CACHE_DEFAULT_TTL, root=CONST_CACHE_ROOT):
+        self.namespace = namespace
+        self.account_id = '{}'.format(account_id)
+        self.region = '{}'.format(region)
+        self.ttl = ttl
+        self.root = os.path.join(root, namespace, self.account_id, self.region)
+
+    def path(self, resource_type):
+        '''Returns the filename used for the snapshot of a resource type'''
+        return os.path.join(self.root, '{}.json'.format(resource_type))
+
+    def age(self, resource_type):
+        '''Returns the age in seconds of a snapshot, or None if not present'''
+
+        try:
+            with open(self.path(resource_type), 'r') as f:
+                created = json.load(f)['created']
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None
+
+        return time.time() - created
+
+    def load(self, resource_type, ttl=None):
+        '''Returns the data held in a snapshot, returning None if the snapshot
+        is missing, unreadable or older than the TTL'''
+
+        ttl = self.ttl if ttl is None else ttl
+        filename = self.path(resource_type)
+
+        try:
+            with open(filename, 'r') as f:
+                snapshot = json.load(f)
+        except (IOError, OSError) as e:
+            _log.debug('No snapshot available at {0}: {1}'.format(filename, e))
+            return None
+        except ValueError:
+            _log.warning('Discarding unreadable snapshot {0}'.format(filename))
+            return None
+
+        try:
+            if snapshot['version'] != CONST_CACHE_FORMAT_VERSION:
+                _log.debug('Ignoring snapshot {0} with old format version'.format(filename))
+                return None
+            age = time.time() - snapshot['created']
+            data = snapshot['data']
+        except (KeyError, TypeError):
+            _log.warning('Discarding malformed snapshot {0}'.format(filename))
+            return None
+
+        if ttl is not None and ttl >= 0 and age > ttl:
+            _log.debug('Snapshot {0} expired ({1:.0f}s > {2}s)'.format(filename, age, ttl))
+            return None
+
+        _log.debug('Loaded snapshot {0} ({1:.0f}s old)'.format(filename, age))
+        return data
+
+    def save(self, resource_type, data):
+        '''Atomically writes a snapshot of the provided JSON serializable data'''
+
+        filename = self.path(resource_type)
+        snapshot = {
+            'version': CONST_CACHE_FORMAT_VERSION,
+            'created': time.time(),
+            'data': data
+        }
+
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            fd, tmp_filename = tempfile.mkstemp(dir=self.root, prefix='.{}.'.format(resource_type), suffix='.tmp')
+        except (IOError, OSError) as e:
+            _log.warning('Unable to write snapshot {0}: {1}'.format(filename, e))
+            return False
+
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(snapshot, f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_filename, filename)
+        except (IOError, OSError, TypeError, ValueError) as e:
+            _log.warning('Unable to write snapshot {0}: {1}'.format(filename, e))
+            _remove_quietly(tmp_filename)
+            return False
+
+        _log.debug('Saved snapshot {0}'.format(filename))
+        return True
+
+    def invalidate(self, resource_type=None):
+        '''Removes the snapshot for a resource type, or all snapshots held for
+        this account and region if no resource type is given'''
+
+        if resource_type is not None:
+            _remove_quietly(self.path(resource_type))
+            return
+
+        try:
+            filenames = os.listdir(self.root)
+        except (IOError, OSError):
+            return
+
+        for filename in filenames:
+            if filename.endswith('.json'):
+                _remove_quietly(os.path.join(self.root, filename))
+
+
+###############################################################################
+# Functions
+###############################################################################
+
+
+def _remove_quietly(filename):
+    try:
+        os.remove(filename)
+        _log.debug('Removed {0}'.format(filename))
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            _log.warning('Unable to remove {0}: {1}'.format(filename, e))
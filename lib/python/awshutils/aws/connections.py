@@ -0,0 +1,201 @@
+# Header will go here when ready to publish
+"""
+Lazily populated, process-wide registry of AWS connections and pool of boto3
+clients used by AWSH tools
+"""
+
+import os
+import time
+import logging
+import threading
+import collections.abc
+from awshutils.logger import LOG_CONTEXT
+from awshutils import check_imports
+
+check_imports()
+_log = logging.getLogger(LOG_CONTEXT)
+
+import boto3
+from botocore.config import Config
+from boto import ec2, vpc, iam
+from boto.ec2 import elb
+from boto.route53 import Route53Connection
+from boto.ec2 import cloudwatch
+
+# Factories for the boto connections a registry can provide, keyed by name
+CONST_CONNECTION_FACTORIES = {
+    'vpc': lambda region: vpc.connect_to_region(region),
+    'ec2': lambda region: ec2.connect_to_region(region),
+    'elb': lambda region: elb.connect_to_region(region),
+    'iam': lambda region: iam.connect_to_region(region),
+    'route53': lambda region: Route53Connection(),
+    'cloudwatch': lambda region: cloudwatch.connect_to_region(region),
+}
+
+# Settings applied to every pooled boto3 client. Adaptive retries back off
+# and rate limit the client when AWS starts throttling it
+CONST_CLIENT_MAX_POOL_CONNECTIONS = int(os.getenv('AWSH_MAX_POOL_CONNECTIONS', 50))
+CONST_CLIENT_MAX_ATTEMPTS = int(os.getenv('AWSH_MAX_ATTEMPTS', 10))
+CONST_CLIENT_RETRY_MODE = os.getenv('AWSH_RETRY_MODE', 'adaptive')
+
+_registries = {}
+_registries_lock = threading.Lock()
+_session = None
+_session_lock = threading.Lock()
+_clients = {}
+_clients_lock = threading.Lock()
+
+###############################################################################
+# Classes
+###############################################################################
+
+
+class ConnectionRegistry(collections.abc.Mapping):
+    '''Dictionary-like registry of the AWS connections for a region. Each
+    connection is only created the first time it is looked up and is then
+    shared by every user of the registry
+    eg.
+        registry['ec2']                  --> boto EC2Connection
+        registry['region']               --> 'eu-west-1'
+        registry.client('directconnect') --> boto3 DirectConnect client
+    '''
+
+    def __init__(self, region):
+        self.region = region
+        self.timings = {}
+        self._connections = {'region': region}
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        try:
+            return self._connections[name]
+        except KeyError:
+            pass
+
+        if name not in CONST_CONNECTION_FACTORIES:
+            raise KeyError(name)
+
+        with self._lock:
+            if name not in self._connections:
+                self._connections[name] = self._timed(name, CONST_CONNECTION_FACTORIES[name], self.region)
+
+        return self._connections[name]
+
+    def __iter__(self):
+        return iter(['region'] + list(CONST_CONNECTION_FACTORIES.keys()))
+
+    def __len__(self):
+        return len(CONST_CONNECTION_FACTORIES) + 1
+
+    def client(self, service):
+        '''Returns the pooled boto3 client of a service for the region'''
+
+        try:
+            return self._clients[service]
+        except KeyError:
+            pass
+
+        with self._lock:
+            if service not in self._clients:
+                self._clients[service] = self._timed(
+                    'client:{}'.format(service),
+                    lambda region: get_client(service, region),
+                    self.region
+                )
+
+        return self._clients[service]
+
+    def _timed(self, name, factory, region):
+        start = time.time()
+        connection = factory(region)
+        self.timings[name] = time.time() - start
+        _log.debug('Initialised {0} connection for {1} in {2:.3f}s'.format(name, region, self.timings[name]))
+        return connection
+
+
+###############################################################################
+# Functions
+###############################################################################
+
+
+def get_session():
+    '''Returns the boto3 session shared by every client in this process'''
+
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                start = time.time()
+                _session = boto3.session.Session()
+                _log.debug('Initialised boto3 session in {0:.3f}s'.format(time.time() - start))
+
+    return _session
+
+
+def get_client_config(**overrides):
+    '''Returns the botocore Config used for pooled clients, with any of its
+    settings overridden'''
+
+    config = Config(
+        max_pool_connections=CONST_CLIENT_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        retries={
+            'max_attempts': CONST_CLIENT_MAX_ATTEMPTS,
+            'mode': CONST_CLIENT_RETRY_MODE
+        }
+    )
+    if overrides:
+        config = config.merge(Config(**overrides))
+    return config
+
+
+def get_client(service, region=None, verify=None, **config):
+    '''Returns the process-wide boto3 client for a service, region and client
+    configuration. Clients are built once from the shared session so their
+    connection pools, and any open connections, are reused by every caller.
+    Extra keyword arguments override the botocore Config settings
+    eg.
+        get_client('s3')
+        get_client('cloudwatch', 'us-east-1')
+        get_client('s3', verify=False, max_pool_connections=100)
+    '''
+
+    region = region or os.getenv('AWS_DEFAULT_REGION') or get_session().region_name
+    key = (service, region, verify, repr(sorted(config.items())))
+
+    try:
+        return _clients[key]
+    except KeyError:
+        pass
+
+    # Building clients from a session is not thread safe
+    with _clients_lock:
+        if key not in _clients:
+            start = time.time()
+            _clients[key] = get_session().client(
+                service,
+                region_name=region,
+                verify=verify,
+                config=get_client_config(**config)
+            )
+            _log.debug('Initialised {0} client for {1} in {2:.3f}s'.format(service, region, time.time() - start))
+
+    return _clients[key]
+
+
+def get_registry(region):
+    '''Returns the process-wide connection registry for a region'''
+
+    with _registries_lock:
+        if region not in _registries:
+            _registries[region] = ConnectionRegistry(region)
+
+    return _registries[region]
+
+
+def connect(name, region):
+    '''Returns a new, unshared boto connection. Intended for worker threads
+    as boto connections are not safe to share between threads'''
+    return CONST_CONNECTION_FACTORIES[name](region)
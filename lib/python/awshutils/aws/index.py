@@ -0,0 +1,181 @@
+# Header will go here when ready to publish
+"""
+Compact in-memory index of AWS resources used by the AWSH resource mapper in
+place of keeping every API object resident
+"""
+
+import logging
+import collections
+from awshutils.logger import LOG_CONTEXT
+
+_log = logging.getLogger(LOG_CONTEXT)
+
+###############################################################################
+# Classes
+###############################################################################
+
+
+class ResourceRecord():
+    '''The handful of attributes AWSH tools need from an AWS resource. The
+    full API object is only attached when a caller asks for it'''
+
+    __slots__ = ('id', 'name', 'vpc_id', 'private_ip', 'public_ip', 'region', 'obj')
+
+    # Attributes persisted in snapshots, in order. The region is implied by
+    # the snapshot location
+    FIELDS = ('id', 'name', 'vpc_id', 'private_ip', 'public_ip')
+
+    def __init__(self, id, name, vpc_id=None, private_ip=None, public_ip=None, region=None):
+        self.id = id
+        self.name = name
+        self.vpc_id = vpc_id
+        self.private_ip = private_ip
+        self.public_ip = public_ip
+        self.region = region
+        self.obj = None
+
+    def __repr__(self):
+        if self.region:
+            return 'ResourceRecord({0}:{1}, {2})'.format(self.region, self.id, self.name)
+        return 'ResourceRecord({0}, {1})'.format(self.id, self.name)
+
+    @classmethod
+    def from_resource(cls, o, name, region=None):
+        '''Builds a record from a boto resource object'''
+        return cls(
+            o.id,
+            name,
+            vpc_id=getattr(o, 'vpc_id', None),
+            private_ip=getattr(o, 'private_ip_address', None),
+            public_ip=getattr(o, 'ip_address', None),
+            region=region
+        )
+
+    @classmethod
+    def from_row(cls, row, region=None):
+        return cls(*row, region=region)
+
+    def to_row(self):
+        return [getattr(self, x) for x in self.FIELDS]
+
+
+class ResourceIndex():
+    '''Index of ResourceRecords for one resource type with a primary index
+    keyed by id and secondary indexes keyed by other record attributes
+    eg.
+        index.get('vpc-63ad4d04')          --> ResourceRecord(vpc-63ad4d04, dev)
+        index.find('name', 'dev')          --> ResourceRecord(vpc-63ad4d04, dev)
+        index.find('private_ip', '10.0.0.1')
+    '''
+
+    def __init__(self, resource_type, secondary=('name',), complete=False, region=None):
+        self.resource_type = resource_type
+        self.region = region
+        self.complete = complete
+        self.by_id = {}
+        self.secondary = {x: {} for x in secondary}
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __iter__(self):
+        return iter(self.by_id.values())
+
+    def __contains__(self, resource_id):
+        return resource_id in self.by_id
+
+    def add(self, record):
+        '''Adds or replaces a record, keeping the secondary indexes in step'''
+
+        previous = self.by_id.get(record.id)
+        if previous is not None:
+            for attribute, index in self.secondary.items():
+                value = getattr(previous, attribute)
+                if value is not None and index.get(value) == previous.id:
+                    del index[value]
+
+        self.by_id[record.id] = record
+        for attribute, index in self.secondary.items():
+            value = getattr(record, attribute)
+            if value is not None:
+                index[value] = record.id
+
+    def get(self, resource_id):
+        '''Returns the record for an id or None if not found'''
+        return self.by_id.get(resource_id)
+
+    def find(self, attribute, value):
+        '''Returns the record with a matching secondary attribute or None'''
+
+        resource_id = self.secondary[attribute].get(value)
+        return None if resource_id is None else self.by_id.get(resource_id)
+
+    def to_snapshot(self):
+        '''Returns a JSON serializable form of the index'''
+        return {'fields': list(ResourceRecord.FIELDS), 'records': [r.to_row() for r in self.by_id.values()]}
+
+    @classmethod
+    def from_snapshot(cls, resource_type, data, secondary=('name',), region=None):
+        '''Rebuilds a complete index from to_snapshot() output, returning None
+        if the snapshot was written with a different record layout'''
+
+        try:
+            if data['fields'] != list(ResourceRecord.FIELDS):
+                return None
+            rows = data['records']
+        except (KeyError, TypeError):
+            return None
+
+        index = cls(resource_type, secondary=secondary, complete=True, region=region)
+        for row in rows:
+            index.add(ResourceRecord.from_row(row, region=region))
+
+        return index
+
+
+class RegionalIndex():
+    '''Merged view of the ResourceIndexes for one resource type across many
+    regions. Records are keyed by (region, id) and secondary lookups return
+    the matches from every region
+    eg.
+        index.locate('i-0123456789abcdef0')  --> [ResourceRecord(eu-west-1:i-0123456789abcdef0, web-01)]
+        index.find('name', 'web-01')         --> [ResourceRecord(eu-west-1:...), ResourceRecord(us-east-1:...)]
+    '''
+
+    def __init__(self, resource_type, secondary=('name',)):
+        self.resource_type = resource_type
+        self.regions = []
+        self.by_key = {}
+        self.by_id = collections.defaultdict(list)
+        self.secondary = {x: collections.defaultdict(list) for x in secondary}
+
+    def __len__(self):
+        return len(self.by_key)
+
+    def __iter__(self):
+        return iter(self.by_key.values())
+
+    def merge(self, region, index):
+        '''Adds every record of a single region ResourceIndex'''
+
+        self.regions.append(region)
+        for record in index:
+            record.region = region
+            self.by_key[(region, record.id)] = record
+            self.by_id[record.id].append(record)
+            for attribute, values in self.secondary.items():
+                value = getattr(record, attribute)
+                if value is not None:
+                    values[value].append(record)
+
+    def get(self, region, resource_id):
+        '''Returns the record for a region and id or None if not found'''
+        return self.by_key.get((region, resource_id))
+
+    def locate(self, resource_id):
+        '''Returns the records with an id, in any region'''
+        return list(self.by_id.get(resource_id, []))
+
+    def find(self, attribute, value):
+        '''Returns the records with a matching secondary attribute'''
+        return list(self.secondary[attribute].get(value, []))
@@ -4,10 +4,17 @@ A simple library of AWS utility functions that are used regularly by AWSH tools
 """
 
 import os
+import re
 import sys
+import time
 import logging
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
 from awshutils.logger import LOG_CONTEXT
 from awshutils import clean_up, CONST_AWSH_ROOT, check_imports
+from awshutils.aws.cache import SnapshotStore, CONST_CACHE_DEFAULT_TTL
+from awshutils.aws.index import ResourceIndex, ResourceRecord, RegionalIndex
 
 ###############################################################################
 # CONFIG - Begin
@@ -19,6 +26,47 @@ CONST_AWS_ENV_VARIABLE_NAMES = [
     'AWS_SECRET_ACCESS_KEY'
 ]
 
+# Seconds for which a snapshot of the lookup tables is trusted. Use 0 to
+# always rebuild the tables from the AWS APIs
+CONST_MAPPER_CACHE_TTL = int(os.getenv('AWSH_MAPPER_CACHE_TTL', CONST_CACHE_DEFAULT_TTL))
+
+# Number of point lookups per resource type after which the mapper gives up on
+# filtered describe calls and builds the full index instead
+CONST_MAPPER_MISS_THRESHOLD = int(os.getenv('AWSH_MAPPER_MISS_THRESHOLD', 10))
+
+# Connection, describe call and id filter used to resolve a single resource
+CONST_POINT_LOOKUPS = {
+    'vpc': ('vpc', 'get_all_vpcs', 'vpc-id'),
+    'instance': ('ec2', 'get_only_instances', 'instance-id'),
+    'sg': ('ec2', 'get_all_security_groups', 'group-id'),
+    'subnet': ('vpc', 'get_all_subnets', 'subnet-id'),
+}
+
+# Record attributes each resource type is indexed by in addition to its id
+CONST_SECONDARY_INDEXES = {
+    'vpc': ('name',),
+    'instance': ('name', 'private_ip', 'public_ip'),
+    'sg': ('name',),
+    'subnet': ('name',),
+}
+
+# Patterns used to tell resource ids apart from 'Name' tags
+CONST_RESOURCE_ID_PATTERNS = {
+    'vpc': re.compile(r'^vpc-[0-9a-f]{8}([0-9a-f]{9})?$'),
+    'instance': re.compile(r'^i-[0-9a-f]{8}([0-9a-f]{9})?$'),
+    'sg': re.compile(r'^sg-[0-9a-f]{8}([0-9a-f]{9})?$'),
+    'subnet': re.compile(r'^subnet-[0-9a-f]{8}([0-9a-f]{9})?$'),
+}
+
+# EC2 accepts at most 200 values for a single describe filter
+CONST_MAX_FILTER_VALUES = 200
+
+# Number of describe calls resolve_many() will run at the same time
+CONST_MAPPER_MAX_WORKERS = int(os.getenv('AWSH_MAPPER_MAX_WORKERS', 8))
+
+# Number of regions MultiRegionResourceMapper will build indexes for at once
+CONST_MAPPER_MAX_REGION_WORKERS = int(os.getenv('AWSH_MAPPER_MAX_REGION_WORKERS', 6))
+
 
 ###############################################################################
 # CONFIG - End (Do Not Edit Below)
@@ -27,12 +75,8 @@ CONST_AWS_ENV_VARIABLE_NAMES = [
 check_imports()
 _log = logging.getLogger(LOG_CONTEXT)
 
-from boto import ec2, vpc, iam
-from boto.ec2 import elb
-from boto.vpc import VPCConnection
-import boto.ec2.networkinterface
-from boto.route53 import Route53Connection
-from boto.ec2 import cloudwatch
+from boto.exception import EC2ResponseError
+from awshutils.aws.connections import get_registry, get_client, connect
 
 ###############################################################################
 # Classes
@@ -45,363 +89,579 @@ class AwsResourceMapper():
         instance-id i-b6b075f5 --> dv-lx-ihsweb-02.dev.abc.cloud.org.ie
         vpc name 'DEV'         --> vpc-id vpc-63ad4d04
         vpc-id vpc-63ad4d04    --> DEV
+
+    Each resource type is held in a ResourceIndex of compact records. The full
+    API object for a resource is only fetched when one of the *_to_vpc style
+    methods asks for it.
+
+    With point_lookups enabled a lookup that misses the index is resolved with
+    a filtered describe call for that single name or id. Once more than
+    miss_threshold such misses are seen for a resource type the full index is
+    built as before. 'Name' tag filters are case sensitive, so in this mode a
+    name is only found when it is given as tagged or in all lower or upper case.
     '''
 
-    def __init__(self):
-        self.resources = _initialise_aws_connections()
-        # VPC lookup tables
-        self.lut_vpc_name_to_id = None
-        self.lut_vpc_name_to_vpc = None
-        self.lut_vpc_id_to_name = None
-        self.lut_vpc_id_to_vpc = None
-        # Instance lookup tables
-        self.lut_instance_name_to_id = None
-        self.lut_instance_name_to_instance = None
-        self.lut_instance_id_to_name = None
-        self.lut_instance_id_to_instance = None
-        # ELB lookup tables
-        self.lut_elb_name_to_id = None
-        self.lut_elb_name_to_elb = None
-        self.lut_elb_id_to_name = None
-        self.lut_elb_id_to_elb = None
-        # SG lookup tables
-        self.lut_sg_name_to_id = None
-        self.lut_sg_name_to_sg = None
-        self.lut_sg_id_to_name = None
-        self.lut_sg_id_to_sg = None
-        # Subnet lookup tables
-        self.lut_subnet_name_to_id = None
-        self.lut_subnet_name_to_subnet = None
-        self.lut_subnet_id_to_name = None
-        self.lut_subnet_id_to_subnet = None
+    def __init__(self, cache_ttl=CONST_MAPPER_CACHE_TTL, point_lookups=False,
+                 miss_threshold=CONST_MAPPER_MISS_THRESHOLD,
+                 max_workers=CONST_MAPPER_MAX_WORKERS, region=None, account_id=None):
+        start = time.time()
+        self.resources = _initialise_aws_connections(region)
+        # Boto connections are not thread safe so workers get their own
+        self.max_workers = max_workers
+        self._local = threading.local()
+        # Snapshot store, created on first use as it needs the account id
+        self.cache_ttl = cache_ttl
+        self.account_id = account_id
+        self._cache = None
+        # Point lookup state
+        self.point_lookups = point_lookups
+        self.miss_threshold = miss_threshold
+        self._misses = collections.defaultdict(int)
+        self._negative = collections.defaultdict(set)
+        # Resource indexes keyed by resource type
+        self.indexes = {}
+        _log.debug('Initialised mapper for {0} in {1:.3f}s'.format(self.resources['region'], time.time() - start))
 
     def get_resources(self):
-        '''Returns a dictionary of the initialised AWS resources'''
+        '''Returns the dictionary-like registry of AWS resources. Connections
+        are created on first access and shared across the process'''
         return self.resources
 
-    def vpc_name_to_id(self, vpc_name):
-        '''Attempts to map a given vpc 'Name' tag to a VPC id, returning None if not found'''
+    def get_index(self, resource_type):
+        '''Returns the complete ResourceIndex for a resource type (vpc,
+        instance, sg, subnet), building it if necessary'''
 
-        if self.lut_vpc_name_to_id is None:
-            self.lut_vpc_name_to_id, self.lut_vpc_name_to_vpc, self.lut_vpc_id_to_name, self.lut_vpc_id_to_vpc = self._get_vpc_luts()
+        index = self.indexes.get(resource_type)
+        if index is None or not index.complete:
+            self._build_index(resource_type)
 
-        try:
-            r = self.lut_vpc_name_to_id[vpc_name.lower()]
-        except KeyError:
-            r = None
+        return self.indexes[resource_type]
 
-        return r
+    def invalidate_cache(self, resource_type=None):
+        '''Discards the snapshot and in-memory index for a resource type (vpc,
+        instance, sg, subnet) or for all resource types if none is given'''
 
-    def vpc_name_to_vpc(self, vpc_name):
-        '''Attempts to map a given vpc 'Name' tag to a VPC, returning None if not found'''
+        resource_types = [resource_type] if resource_type else list(CONST_POINT_LOOKUPS.keys())
 
-        if self.lut_vpc_name_to_vpc is None:
-            self.lut_vpc_name_to_id, self.lut_vpc_name_to_vpc, self.lut_vpc_id_to_name, self.lut_vpc_id_to_vpc = self._get_vpc_luts()
+        for r in resource_types:
+            self.indexes.pop(r, None)
+            self._misses.pop(r, None)
+            self._negative.pop(r, None)
 
-        try:
-            r = self.lut_vpc_name_to_vpc[vpc_name.lower()]
-        except KeyError:
-            r = None
+        cache = self._get_cache()
+        if cache is not None:
+            cache.invalidate(resource_type)
+
+    def vpc_name_to_id(self, vpc_name):
+        '''Attempts to map a given vpc 'Name' tag to a VPC id, returning None if not found'''
+        return _record_id(self._find('vpc', name=vpc_name))
 
-        return r
+    def vpc_name_to_vpc(self, vpc_name):
+        '''Attempts to map a given vpc 'Name' tag to a VPC, returning None if not found'''
+        return self._object('vpc', self._find('vpc', name=vpc_name))
 
     def vpc_id_to_name(self, vpc_id):
         '''Attempts to map a given vpc id to a 'Name' tag, returning None if not found'''
+        return _record_name(self._find('vpc', resource_id=vpc_id))
 
-        if self.lut_vpc_id_to_name is None:
-            self.lut_vpc_name_to_id, self.lut_vpc_name_to_vpc, self.lut_vpc_id_to_name, self.lut_vpc_id_to_vpc = self._get_vpc_luts()
+    def vpc_id_to_vpc(self, vpc_id):
+        '''Attempts to map a given vpc id to a VPC, returning None if not found'''
+        return self._object('vpc', self._find('vpc', resource_id=vpc_id))
 
-        try:
-            r = self.lut_vpc_id_to_name[vpc_id]
-        except KeyError:
-            r = None
+    def instance_name_to_id(self, instance_name):
+        '''Attempts to map a given instance 'Name' tag to an instance id, returning None if not found'''
+        return _record_id(self._find('instance', name=instance_name))
 
-        return r
+    def instance_name_to_instance(self, instance_name):
+        '''Attempts to map a given instance 'Name' tag to an instance, returning None if not found'''
+        return self._object('instance', self._find('instance', name=instance_name))
 
-    def vpc_id_to_vpc(self, vpc_id):
-        '''Attempts to map a given vpc id to a VPC, returning None if not found'''
+    def instance_id_to_name(self, instance_id):
+        '''Attempts to map a given instance id to an instance 'Name' tag, returning None if not found'''
+        return _record_name(self._find('instance', resource_id=instance_id))
 
-        if self.lut_vpc_id_to_vpc is None:
-            self.lut_vpc_name_to_id, self.lut_vpc_name_to_vpc, self.lut_vpc_id_to_name, self.lut_vpc_id_to_vpc = self._get_vpc_luts()
+    def instance_id_to_instance(self, instance_id):
+        '''Attempts to map a given instance id to an instance, returning None if not found'''
+        return self._object('instance', self._find('instance', resource_id=instance_id))
 
-        try:
-            r = self.lut_vpc_id_to_vpc[vpc_id]
-        except KeyError:
-            r = None
+    def sg_name_to_id(self, sg_name):
+        '''Attempts to map a given sg 'Name' tag to an sg id, returning None if not found'''
+        return _record_id(self._find('sg', name=sg_name))
 
-        return r
+    def sg_name_to_sg(self, sg_name):
+        '''Attempts to map a given sg 'Name' tag to an sg, returning None if not found'''
+        return self._object('sg', self._find('sg', name=sg_name))
 
-    def _get_vpc_luts(self):
-        '''Returns a set of LUTs of vpc-ids to names and vpc-names to vpc-ids'''
+    def sg_id_to_name(self, sg_id):
+        '''Attempts to map a given sg id to an sg 'Name' tag, returning None if not found'''
+        return _record_name(self._find('sg', resource_id=sg_id))
 
-        names_to_ids = {}
-        names_to_vpcs = {}
-        ids_to_names = {}
-        ids_to_vpcs = {}
+    def sg_id_to_sg(self, sg_id):
+        '''Attempts to map a given sg id to an sg, returning None if not found'''
+        return self._object('sg', self._find('sg', resource_id=sg_id))
 
-        _log.debug('Retrieving VPC information')
-        vpcs = self.resources['vpc'].get_all_vpcs()
-        _log.debug('Discovered {0} VPCs'.format(len(vpcs)))
+    def subnet_name_to_id(self, subnet_name):
+        '''Attempts to map a given subnet 'Name' tag to an subnet id, returning None if not found'''
+        return _record_id(self._find('subnet', name=subnet_name))
 
-        for v in vpcs:
+    def subnet_name_to_subnet(self, subnet_name):
+        '''Attempts to map a given subnet 'Name' tag to an subnet, returning None if not found'''
+        return self._object('subnet', self._find('subnet', name=subnet_name))
 
-            try:
-                vpc_name = v.tags['Name'].lower()
-                names_to_ids[vpc_name] = v.id
-                names_to_vpcs[vpc_name] = v
-                ids_to_names[v.id] = vpc_name
-                ids_to_vpcs[v.id] = v
+    def subnet_id_to_name(self, subnet_id):
+        '''Attempts to map a given subnet id to an subnet 'Name' tag, returning None if not found'''
+        return _record_name(self._find('subnet', resource_id=subnet_id))
 
-            except KeyError:
-                _log.warning('Found a VPC [{0}] with no Name tag'.format(v.id))
+    def subnet_id_to_subnet(self, subnet_id):
+        '''Attempts to map a given subnet id to an subnet, returning None if not found'''
+        return self._object('subnet', self._find('subnet', resource_id=subnet_id))
 
-        return names_to_ids, names_to_vpcs, ids_to_names, ids_to_vpcs
+    def resolve_many(self, kind, names_or_ids):
+        '''Resolves many names and/or ids of one resource type (vpc, instance,
+        sg, subnet) with as few describe calls as possible. Names map to ids
+        and ids map to names, following the same case-folding rules as the
+        *_name_to_id and *_id_to_name methods.
+
+        Returns a tuple of a dict of results keyed by the values provided and
+        a list of the values that could not be resolved'''
 
-    def instance_name_to_id(self, instance_name):
-        '''Attempts to map a given instance 'Name' tag to an instance id, returning None if not found'''
+        if kind not in CONST_POINT_LOOKUPS:
+            raise ValueError('Unsupported resource type {0}'.format(kind))
 
-        if self.lut_instance_name_to_id is None:
-            self.lut_instance_name_to_id, self.lut_instance_name_to_instance, self.lut_instance_id_to_name, self.lut_instance_id_to_instance = self._get_instance_luts()
+        values = list(collections.OrderedDict.fromkeys('{}'.format(x) for x in names_or_ids))
+        index = self._get_partial_index(kind)
 
-        try:
-            r = self.lut_instance_name_to_id[instance_name.lower()]
-        except KeyError:
-            r = None
+        def _lookup(value):
+            key = value.lower()
+            if _is_resource_id(kind, key) and key in index:
+                return index.get(key).name
+            return _record_id(index.find('name', key))
+
+        if not index.complete:
+            negative = self._negative[kind]
+            pending = [x for x in values if _lookup(x) is None and x.lower() not in negative]
+            if pending:
+                self._resolve_batches(kind, pending)
+                # As with point lookups, values the batches could not find are
+                # reported as misses rather than building the full index
+                negative.update(x.lower() for x in pending if _lookup(x) is None)
 
-        return r
+        results = {}
+        misses = []
+        for value in values:
+            r = _lookup(value)
+            if r is None:
+                misses.append(value)
+            else:
+                results[value] = r
+
+        _log.debug('Resolved {0} of {1} {2} values'.format(len(results), len(values), kind))
+        return results, misses
+
+    def _find(self, resource_type, name=None, resource_id=None):
+        '''Returns the record for a name or id, or None if not found'''
 
-    def instance_name_to_instance(self, instance_name):
-        '''Attempts to map a given instance 'Name' tag to an instance, returning None if not found'''
+        index = self._ensure_index(resource_type, name=name, resource_id=resource_id)
 
-        if self.lut_instance_name_to_instance is None:
-            self.lut_instance_name_to_id, self.lut_instance_name_to_instance, self.lut_instance_id_to_name, self.lut_instance_id_to_instance = self._get_instance_luts()
+        if name is not None:
+            return index.find('name', '{}'.format(name).lower())
+
+        return index.get('{}'.format(resource_id).lower())
+
+    def _object(self, resource_type, record):
+        '''Returns the full API object for a record, fetching it on first use'''
+
+        if record is None:
+            return None
+
+        if record.obj is None:
+            record.obj = self._fetch(resource_type, record.id)
 
-        try:
-            r = self.lut_instance_name_to_instance[instance_name.lower()]
-        except KeyError:
-            r = None
+        return record.obj
 
-        return r
+    def _fetch(self, resource_type, resource_id):
+        '''Returns a single resource by id or None if not found'''
+
+        _, _, id_filter = CONST_POINT_LOOKUPS[resource_type]
+        r = self._describe(resource_type, {id_filter: resource_id})
+        return r[0] if r else None
+
+    def _ensure_index(self, resource_type, name=None, resource_id=None):
+        '''Returns an index for a resource type that is able to answer a lookup
+        for the given name or id'''
+
+        index = self.indexes.get(resource_type)
+        if index is not None and index.complete:
+            return index
+
+        if not self.point_lookups:
+            return self._build_index(resource_type)
+
+        index = self._get_partial_index(resource_type)
+        if index.complete:
+            return index
+
+        if name is not None:
+            key = '{}'.format(name).lower()
+            found = index.find('name', key) is not None
+        else:
+            key = '{}'.format(resource_id).lower()
+            found = key in index
+
+        if found or key in self._negative[resource_type]:
+            return index
+
+        self._misses[resource_type] += 1
+        if self._misses[resource_type] > self.miss_threshold:
+            _log.debug('Point lookup threshold ({0}) crossed for {1}. Building full index'.format(self.miss_threshold, resource_type))
+            return self._build_index(resource_type)
 
-    def instance_id_to_name(self, instance_id):
-        '''Attempts to map a given instance id to an instance 'Name' tag, returning None if not found'''
+        self._point_lookup(resource_type, name=name, resource_id=resource_id)
+        if name is not None:
+            found = index.find('name', key) is not None
+        else:
+            found = key in index
+        if not found:
+            self._negative[resource_type].add(key)
 
-        if self.lut_instance_id_to_name is None:
-            self.lut_instance_name_to_id, self.lut_instance_name_to_instance, self.lut_instance_id_to_name, self.lut_instance_id_to_instance = self._get_instance_luts()
+        return index
 
-        try:
-            r = self.lut_instance_id_to_name[instance_id.lower()]
-        except KeyError:
-            r = None
+    def _get_partial_index(self, resource_type):
+        '''Returns the current index for a resource type, preferring a valid
+        snapshot and otherwise starting an empty partial index'''
 
-        return r
+        index = self.indexes.get(resource_type)
+        if index is None:
+            # A valid snapshot is always cheaper than any API call
+            index = self._load_cached_index(resource_type)
+            if index is None:
+                index = ResourceIndex(resource_type, secondary=CONST_SECONDARY_INDEXES[resource_type], region=self.resources['region'])
+            self.indexes[resource_type] = index
 
-    def instance_id_to_instance(self, instance_id):
-        '''Attempts to map a given instance id to an instance, returning None if not found'''
+        return index
 
-        if self.lut_instance_id_to_instance is None:
-            self.lut_instance_name_to_id, self.lut_instance_name_to_instance, self.lut_instance_id_to_name, self.lut_instance_id_to_instance = self._get_instance_luts()
+    def _build_index(self, resource_type):
+        '''Builds the complete index for a resource type from a snapshot or
+        from a complete listing of the resources'''
 
-        try:
-            r = self.lut_instance_id_to_instance[instance_id.lower()]
-        except KeyError:
-            r = None
+        index = self._load_cached_index(resource_type)
 
-        return r
+        if index is None:
+            index = ResourceIndex(resource_type, secondary=CONST_SECONDARY_INDEXES[resource_type], complete=True, region=self.resources['region'])
+            for o in self._list_all(resource_type):
+                record = _resource_record(resource_type, o, region=self.resources['region'])
+                if record is not None:
+                    index.add(record)
+            self._save_cached_index(index)
 
-    def _get_instance_luts(self):
-        '''Returns a set of LUTs of instance-ids to names and instance-names to ids'''
+        self.indexes[resource_type] = index
+        return index
 
-        names_to_ids = {}
-        names_to_instances = {}
-        ids_to_names = {}
-        ids_to_instances = {}
+    def _list_all(self, resource_type):
+        '''Returns every resource of a type in the region'''
 
-        _log.info('Retrieving Instance information')
-        reservations = self.resources['ec2'].get_all_reservations()
-        instances = [ i for r in reservations for i in r.instances ]
-        _log.debug('Discovered {0} instances'.format(len(instances)))
+        _log.info('Retrieving {0} information'.format(resource_type))
 
-        for i in instances:
+        if resource_type == 'instance':
+            reservations = self.resources['ec2'].get_all_reservations()
+            resources = [i for r in reservations for i in r.instances]
+        else:
+            connection, method, _ = CONST_POINT_LOOKUPS[resource_type]
+            resources = getattr(self.resources[connection], method)()
 
-            try:
-                instance_name = i.tags['Name'].lower()
-                names_to_ids[instance_name] = i.id
-                names_to_instances[instance_name] = i
-                ids_to_names[i.id] = instance_name
-                ids_to_instances[i.id] = i
-            except KeyError:
-                _log.warning('Found an instance [{0}] with no Name tag'.format(i.id))
+        _log.debug('Discovered {0} {1} resources'.format(len(resources), resource_type))
+        return resources
 
-        return names_to_ids, names_to_instances, ids_to_names, ids_to_instances
+    def _point_lookup(self, resource_type, name=None, resource_id=None):
+        '''Resolves a single name or id using server-side filters and adds any
+        matches to the partial index for the resource type'''
 
-    def sg_name_to_id(self, sg_name):
-        '''Attempts to map a given sg 'Name' tag to an sg id, returning None if not found'''
+        _, _, id_filter = CONST_POINT_LOOKUPS[resource_type]
+
+        if resource_id is not None:
+            _log.debug('Point lookup of {0} id {1}'.format(resource_type, resource_id))
+            results = self._describe(resource_type, {id_filter: '{}'.format(resource_id).lower()})
+        else:
+            # Tag filters are case sensitive while the index is not, so try the
+            # common spellings. Names tagged in any other case are not found
+            name = '{}'.format(name)
+            values = _name_variants(name)
+            _log.debug('Point lookup of {0} name {1}'.format(resource_type, name))
+            results = self._describe(resource_type, {'tag:Name': values})
+
+            if not results and resource_type == 'sg':
+                results = self._describe(resource_type, {'group-name': values})
+
+            if not results and resource_type == 'subnet':
+                results = self._describe(resource_type, {id_filter: name.lower()})
+
+        self._add_to_index(resource_type, results)
+        return results
+
+    def _add_to_index(self, resource_type, results):
+        '''Adds described resources to the partial index for a resource type.
+        The objects were fetched anyway so they are kept on the records'''
+
+        index = self.indexes[resource_type]
+
+        for o in results:
+            record = _resource_record(resource_type, o, region=self.resources['region'])
+            if record is not None:
+                record.obj = o
+                index.add(record)
 
-        if self.lut_sg_name_to_id is None:
-            self.lut_sg_name_to_id, self.lut_sg_name_to_sg, self.lut_sg_id_to_name, self.lut_sg_id_to_sg = self._get_sg_luts()
+    def _describe(self, resource_type, filters, resources=None):
+        '''Runs the filtered describe call for a resource type'''
+
+        connection, method, _ = CONST_POINT_LOOKUPS[resource_type]
+        resources = self.resources if resources is None else resources
 
         try:
-            r = self.lut_sg_name_to_id['{}'.format(sg_name).lower()]
-        except KeyError:
-            r = None
+            return getattr(resources[connection], method)(filters=filters)
+        except EC2ResponseError as e:
+            _log.warning('Unable to describe {0} with filters {1}: {2}'.format(resource_type, filters, e))
+            return []
 
-        return r
+    def _resolve_batches(self, kind, values):
+        '''Describes the given names and ids in batches of filter values using
+        a pool of worker threads and adds the results to the partial index'''
 
-    def sg_name_to_sg(self, sg_name):
-        '''Attempts to map a given sg 'Name' tag to an sg, returning None if not found'''
+        _, _, id_filter = CONST_POINT_LOOKUPS[kind]
 
-        if self.lut_sg_name_to_sg is None:
-            self.lut_sg_name_to_id, self.lut_sg_name_to_sg, self.lut_sg_id_to_name, self.lut_sg_id_to_sg = self._get_sg_luts()
+        ids = [x.lower() for x in values if _is_resource_id(kind, x.lower())]
+        names = [x for x in values if not _is_resource_id(kind, x.lower())]
 
-        try:
-            r = self.lut_sg_name_to_sg['{}'.format(sg_name).lower()]
-        except KeyError:
-            r = None
+        jobs = [(id_filter, batch) for batch in _batch_values([[x] for x in ids])]
+        jobs += [('tag:Name', batch) for batch in _batch_values([_name_variants(x) for x in names])]
+        self._add_to_index(kind, self._run_describe_jobs(kind, jobs))
 
-        return r
+        # Security groups without a 'Name' tag are known by their GroupName
+        if kind == 'sg':
+            index = self.indexes[kind]
+            names = [x for x in names if index.find('name', x.lower()) is None]
+            jobs = [('group-name', batch) for batch in _batch_values([_name_variants(x) for x in names])]
+            self._add_to_index(kind, self._run_describe_jobs(kind, jobs))
 
-    def sg_id_to_name(self, sg_id):
-        '''Attempts to map a given sg id to an sg 'Name' tag, returning None if not found'''
+    def _run_describe_jobs(self, kind, jobs):
+        '''Runs a list of (filter name, filter values) describe calls on a
+        bounded thread pool and returns all of the described resources'''
 
-        if self.lut_sg_id_to_name is None:
-            self.lut_sg_name_to_id, self.lut_sg_name_to_sg, self.lut_sg_id_to_name, self.lut_sg_id_to_sg = self._get_sg_luts()
+        if not jobs:
+            return []
 
-        try:
-            r = self.lut_sg_id_to_name['{}'.format(sg_id).lower()]
-        except KeyError:
-            r = None
+        def _job(job):
+            filter_name, filter_values = job
+            return self._describe(kind, {filter_name: filter_values}, resources=self._thread_resources())
 
-        return r
+        _log.debug('Running {0} batched {1} describe calls'.format(len(jobs), kind))
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(jobs)))) as pool:
+            return [o for results in pool.map(_job, jobs) for o in results]
 
-    def sg_id_to_sg(self, sg_id):
-        '''Attempts to map a given sg id to an sg, returning None if not found'''
+    def _thread_resources(self):
+        '''Returns the EC2 and VPC connections owned by the calling thread'''
 
-        if self.lut_sg_id_to_sg is None:
-            self.lut_sg_name_to_id, self.lut_sg_name_to_sg, self.lut_sg_id_to_name, self.lut_sg_id_to_sg = self._get_sg_luts()
+        if not hasattr(self._local, 'resources'):
+            region = self.resources['region']
+            self._local.resources = {
+                'vpc': connect('vpc', region),
+                'ec2': connect('ec2', region),
+            }
 
-        try:
-            r = self.lut_sg_id_to_sg['{}'.format(sg_id).lower()]
-        except KeyError:
-            r = None
+        return self._local.resources
 
-        return r
+    def _get_cache(self):
+        '''Returns the snapshot store for the current account and region or
+        None if caching is disabled'''
 
-    def _get_sg_luts(self):
-        '''Returns a set of LUTs of sg-ids to names and sg-names to ids'''
+        if self.cache_ttl is None or self.cache_ttl <= 0:
+            return None
 
-        names_to_ids = {}
-        names_to_sgs = {}
-        ids_to_names = {}
-        ids_to_sgs = {}
+        if self._cache is None:
+            account_id = self.account_id or _get_account_id()
+            if account_id is None:
+                _log.debug('Unable to determine account id. Snapshot cache disabled')
+                self.cache_ttl = None
+                return None
+            self._cache = SnapshotStore('mapper', account_id, self.resources['region'], ttl=self.cache_ttl)
 
-        _log.info('Retrieving SG information')
-        sgs = self.resources['ec2'].get_all_security_groups()
-        _log.debug('Discovered {0} sgs'.format(len(sgs)))
+        return self._cache
 
-        for s in sgs:
+    def _load_cached_index(self, resource_type):
+        '''Returns the complete index for a resource type from the snapshot
+        store or None if no valid snapshot exists'''
 
-            try:
-                sg_name = s.tags['Name'].lower()
-                names_to_ids[sg_name] = s.id
-                names_to_sgs[sg_name] = s
-                ids_to_names[s.id] = sg_name
-                ids_to_sgs[s.id] = s
-            except KeyError:
-                # If the SG has no 'Name' tag then we'll use the 'GroupName' tag
-                # instead...fugly.
-                _log.warning('Found an sg [{0}] with no Name tag'.format(s.id))
-                sg_name = s.name.lower()
-                names_to_ids[sg_name] = s.id
-                names_to_sgs[sg_name] = s
-                ids_to_names[s.id] = sg_name
-                ids_to_sgs[s.id] = s
-
-        return names_to_ids, names_to_sgs, ids_to_names, ids_to_sgs
+        cache = self._get_cache()
+        if cache is None:
+            return None
 
-    def subnet_name_to_id(self, subnet_name):
-        '''Attempts to map a given subnet 'Name' tag to an subnet id, returning None if not found'''
+        data = cache.load(resource_type)
+        if data is None:
+            return None
 
-        if self.lut_subnet_name_to_id is None:
-            self.lut_subnet_name_to_id, self.lut_subnet_name_to_subnet, self.lut_subnet_id_to_name, self.lut_subnet_id_to_subnet = self._get_subnet_luts()
+        index = ResourceIndex.from_snapshot(resource_type, data, secondary=CONST_SECONDARY_INDEXES[resource_type], region=self.resources['region'])
+        if index is not None:
+            _log.debug('Using cached index of {0} {1} resources'.format(len(index), resource_type))
 
-        try:
-            r = self.lut_subnet_name_to_id[subnet_name.lower()]
-        except KeyError:
-            r = None
+        return index
 
-        return r
+    def _save_cached_index(self, index):
+        '''Persists a complete index to the snapshot store'''
 
-    def subnet_name_to_subnet(self, subnet_name):
-        '''Attempts to map a given subnet 'Name' tag to an subnet, returning None if not found'''
+        cache = self._get_cache()
+        if cache is not None:
+            cache.save(index.resource_type, index.to_snapshot())
 
-        if self.lut_subnet_name_to_subnet is None:
-            self.lut_subnet_name_to_id, self.lut_subnet_name_to_subnet, self.lut_subnet_id_to_name, self.lut_subnet_id_to_subnet = self._get_subnet_luts()
 
-        try:
-            r = self.lut_subnet_name_to_subnet[subnet_name.lower()]
-        except KeyError:
-            r = None
+class MultiRegionResourceMapper():
+    '''Helper class for finding resources across every enabled region
+    eg.
+        m = MultiRegionResourceMapper()
+        m.locate('instance', 'web-01')  --> [ResourceRecord(eu-west-1:i-0123..., web-01)]
+
+    The index for each region is built by an AwsResourceMapper on a bounded
+    pool of worker threads and merged into one RegionalIndex. The time taken
+    and any failure for each region are kept in region_stats; a failing
+    region is logged and left out rather than aborting the lookup. The
+    account id is looked up once and shared by the per-region mappers.
+    '''
 
-        return r
+    def __init__(self, regions=None, max_workers=CONST_MAPPER_MAX_REGION_WORKERS, **mapper_options):
+        self.regions = regions
+        self.max_workers = max_workers
+        self.mapper_options = mapper_options
+        self.mappers = {}
+        self.indexes = {}
+        self.region_stats = {}
 
-    def subnet_id_to_name(self, subnet_id):
-        '''Attempts to map a given subnet id to an subnet 'Name' tag, returning None if not found'''
+    def get_regions(self):
+        '''Returns the regions to search, defaulting to every region enabled
+        for the account'''
 
-        if self.lut_subnet_id_to_name is None:
-            self.lut_subnet_name_to_id, self.lut_subnet_name_to_subnet, self.lut_subnet_id_to_name, self.lut_subnet_id_to_subnet = self._get_subnet_luts()
+        if self.regions is None:
+            resources = _initialise_aws_connections()
+            self.regions = sorted([x.name for x in resources['ec2'].get_all_regions()])
+            _log.debug('Discovered {0} enabled regions'.format(len(self.regions)))
 
-        try:
-            r = self.lut_subnet_id_to_name[subnet_id.lower()]
-        except KeyError:
-            r = None
+        return self.regions
 
-        return r
+    def get_index(self, resource_type):
+        '''Returns the RegionalIndex for a resource type, building the index
+        in every region if necessary'''
 
-    def subnet_id_to_subnet(self, subnet_id):
-        '''Attempts to map a given subnet id to an subnet, returning None if not found'''
+        if resource_type not in self.indexes:
+            self.indexes[resource_type] = self._build(resource_type)
 
-        if self.lut_subnet_id_to_subnet is None:
-            self.lut_subnet_name_to_id, self.lut_subnet_name_to_subnet, self.lut_subnet_id_to_name, self.lut_subnet_id_to_subnet = self._get_subnet_luts()
+        return self.indexes[resource_type]
 
-        try:
-            r = self.lut_subnet_id_to_subnet[subnet_id.lower()]
-        except KeyError:
-            r = None
+    def locate(self, kind, name_or_id):
+        '''Returns the records matching an id or 'Name' tag in any region'''
 
-        return r
+        index = self.get_index(kind)
+        key = '{}'.format(name_or_id).lower()
 
-    def _get_subnet_luts(self):
-        '''Returns a set of LUTs of subnet-ids to names and subnet-names to ids'''
+        if _is_resource_id(kind, key):
+            return index.locate(key)
 
-        names_to_ids = {}
-        names_to_subnets = {}
-        ids_to_names = {}
-        ids_to_subnets = {}
+        return index.find('name', key)
 
-        _log.info('Retrieving Subnet information')
-        subnets = self.resources['vpc'].get_all_subnets()
-        _log.debug('Discovered {0} subnets'.format(len(subnets)))
+    def _build(self, resource_type):
+        '''Builds the index for a resource type in every region concurrently'''
 
-        for s in subnets:
+        regions = self.get_regions()
+        if self.mapper_options.get('cache_ttl', CONST_MAPPER_CACHE_TTL) and 'account_id' not in self.mapper_options:
+            self.mapper_options['account_id'] = _get_account_id()
+        merged = RegionalIndex(resource_type, secondary=CONST_SECONDARY_INDEXES[resource_type])
+        stats = self.region_stats.setdefault(resource_type, {})
 
+        def _job(region):
+            start = time.time()
             try:
-                subnet_name = s.tags['Name'].lower()
-                names_to_ids[subnet_name] = s.id
-                names_to_subnets[subnet_name] = s
-                ids_to_names[s.id] = subnet_name
-                ids_to_subnets[s.id] = s
-            except KeyError:
-                # If the SG has no 'Name' tag then we'll use the 'GroupName' tag
-                # instead...fugly.
-                _log.warning('Found a subnet [{0}] with no Name tag'.format(s.id))
-                subnet_name = s.id
-                names_to_ids[subnet_name] = s.id
-                names_to_subnets[subnet_name] = s
-                ids_to_names[s.id] = subnet_name
-                ids_to_subnets[s.id] = s
-
-        return names_to_ids, names_to_subnets, ids_to_names, ids_to_subnets
+                if region not in self.mappers:
+                    self.mappers[region] = AwsResourceMapper(region=region, **self.mapper_options)
+                index = self.mappers[region].get_index(resource_type)
+                return region, index, time.time() - start, None
+            except Exception as e:
+                return region, None, time.time() - start, e
+
+        _log.info('Retrieving {0} information from {1} regions'.format(resource_type, len(regions)))
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(regions)))) as pool:
+            for region, index, elapsed, error in pool.map(_job, regions):
+                stats[region] = {
+                    'elapsed': elapsed,
+                    'count': 0 if index is None else len(index),
+                    'error': None if error is None else '{}'.format(error)
+                }
+                if error is not None:
+                    _log.warning('Unable to retrieve {0} information for {1} after {2:.2f}s: {3}'.format(resource_type, region, elapsed, error))
+                    continue
+                _log.debug('Retrieved {0} {1} resources from {2} in {3:.2f}s'.format(len(index), resource_type, region, elapsed))
+                merged.merge(region, index)
+
+        return merged
+
+
+###############################################################################
+# Functions
+###############################################################################
+
+
+def _record_id(record):
+    return None if record is None else record.id
+
+
+def _record_name(record):
+    return None if record is None else record.name
+
+
+def _is_resource_id(resource_type, value):
+    '''Returns True if the value looks like an id of the resource type'''
+    return CONST_RESOURCE_ID_PATTERNS[resource_type].match(value) is not None
+
+
+def _name_variants(name):
+    '''Returns the spellings of a name tried against case sensitive filters'''
+    return list(collections.OrderedDict.fromkeys([name, name.lower(), name.upper()]))
+
+
+def _batch_values(groups, limit=CONST_MAX_FILTER_VALUES):
+    '''Packs groups of filter values into batches of at most limit values
+    without splitting a group across batches. Values already sent in an
+    earlier group are left out'''
+
+    seen = set()
+    batch = []
+    for group in groups:
+        group = [x for x in group if x not in seen]
+        if not group:
+            continue
+        seen.update(group)
+        if batch and len(batch) + len(group) > limit:
+            yield batch
+            batch = []
+        batch.extend(group)
+
+    if batch:
+        yield batch
+
+
+def _resource_record(resource_type, o, region=None):
+    '''Returns the index record for a resource using its lower-case 'Name'
+    tag. Security groups without one fall back to their GroupName and
+    subnets to their id, other resources are skipped'''
+
+    try:
+        return ResourceRecord.from_resource(o, o.tags['Name'].lower(), region=region)
+    except KeyError:
+        pass
+
+    _log.warning('Found a {0} [{1}] with no Name tag'.format(resource_type, o.id))
+
+    if resource_type == 'sg':
+        return ResourceRecord.from_resource(o, o.name.lower(), region=region)
+    if resource_type == 'subnet':
+        return ResourceRecord.from_resource(o, o.id, region=region)
+
+    return None
 
 
 def _validate_environment():
@@ -420,7 +680,22 @@ def _validate_environment():
             sys.exit(1)
 
 
-def _initialise_aws_connections():
+def _get_account_id():
+    '''Returns the AWS account id for the loaded credentials, preferring the
+    value exported by the AWSH login process over an STS call'''
+
+    account_id = os.getenv('AWS_ACCOUNT_NUMBER', None)
+    if account_id:
+        return account_id
+
+    try:
+        return get_client('sts').get_caller_identity()['Account']
+    except Exception as e:
+        _log.debug('Unable to retrieve account id from STS: {0}'.format(e))
+        return None
+
+
+def _initialise_aws_connections(region=None):
     _log.info('Initialising AWS Connections')
 
     _validate_environment()
@@ -428,17 +703,8 @@ def _initialise_aws_connections():
     # Even though the Boto lib can use the environment variables we'll import one
     # for easier re-use in this script
     _log.info('Loading credentials from Environment')
-    aws_region = os.getenv('AWS_DEFAULT_REGION')
-
-    _log.info('Initializing Boto resources')
-    resources = {
-        'vpc': vpc.connect_to_region(aws_region),
-        'ec2': ec2.connect_to_region(aws_region),
-        'elb': elb.connect_to_region(aws_region),
-        'iam': iam.connect_to_region(aws_region),
-        'route53': Route53Connection(),
-        'cloudwatch': cloudwatch.connect_to_region(aws_region),
-        'region': aws_region
-    }
-
-    return resources
+    aws_region = region or os.getenv('AWS_DEFAULT_REGION')
+
+    # Connections are only created as they are first used and are shared by
+    # every mapper in the process
+    return get_registry(aws_region)
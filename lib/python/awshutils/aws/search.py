@@ -0,0 +1,230 @@
+# Header will go here when ready to publish
+"""
+Prefix and fuzzy search over EC2 instance names, ids and IP addresses used for
+shell completion and for resolving partial names given to awsh-ssh
+"""
+
+import os
+import bisect
+import difflib
+import logging
+from awshutils.logger import LOG_CONTEXT
+from awshutils.aws.cache import SnapshotStore
+
+###############################################################################
+# CONFIG - Begin
+###############################################################################
+
+# Seconds for which a persisted search index is trusted. Lookups that find
+# nothing in an older index trigger a rebuild
+CONST_SEARCH_CACHE_TTL = int(os.getenv('AWSH_SEARCH_CACHE_TTL', 3600))
+
+# Minimum difflib similarity for a fuzzy match
+CONST_SEARCH_FUZZY_CUTOFF = 0.6
+
+# Number of names sharing the most trigrams with a query that are scored
+# with difflib when looking for fuzzy matches
+CONST_SEARCH_FUZZY_CANDIDATES = 200
+
+###############################################################################
+# CONFIG - End (Do Not Edit Below)
+###############################################################################
+
+_log = logging.getLogger(LOG_CONTEXT)
+
+###############################################################################
+# Classes
+###############################################################################
+
+
+class InstanceSearchIndex():
+    '''Sorted key index over instance names, ids and IPs. Every key points at
+    an instance row of [id, name, private_ip, public_ip]. Prefix lookups are a
+    binary search over the sorted keys so they stay fast for tens of thousands
+    of instances
+    eg.
+        index.complete('web-')        --> ['web-01', 'web-02']
+        index.search('web-01')        --> [['i-0123...', 'web-01', '10.0.0.1', None]]
+        index.search('wbe-01')        --> fuzzy matches when nothing else matches
+    '''
+
+    def __init__(self, rows, keys=None, slots=None):
+        self.rows = rows
+        self.cached = False
+
+        if keys is None or slots is None:
+            entries = sorted(
+                (k.lower(), n)
+                for n, row in enumerate(rows)
+                for k in row if k
+            )
+            keys = [k for k, _ in entries]
+            slots = [n for _, n in entries]
+
+        self.keys = keys
+        self.slots = slots
+
+    def __len__(self):
+        return len(self.rows)
+
+    @classmethod
+    def from_index(cls, index):
+        '''Builds a search index from the mapper's instance ResourceIndex'''
+        return cls([[r.id, r.name, r.private_ip, r.public_ip] for r in index])
+
+    @classmethod
+    def from_snapshot(cls, data):
+        try:
+            index = cls(data['rows'], keys=data['keys'], slots=data['slots'])
+        except (KeyError, TypeError):
+            return None
+
+        index.cached = True
+        return index
+
+    def to_snapshot(self):
+        return {'rows': self.rows, 'keys': self.keys, 'slots': self.slots}
+
+    def complete(self, prefix, limit=None):
+        '''Returns the distinct keys starting with a prefix, in sorted order'''
+
+        prefix = prefix.lower()
+        results = []
+        n = bisect.bisect_left(self.keys, prefix)
+
+        while n < len(self.keys) and self.keys[n].startswith(prefix):
+            if not results or results[-1] != self.keys[n]:
+                results.append(self.keys[n])
+                if limit and len(results) >= limit:
+                    break
+            n += 1
+
+        return results
+
+    def match(self, query, reachable=False):
+        '''Returns the instance rows whose id, name or IP equals the query or,
+        failing that, starts with it. Never returns approximate matches. With
+        reachable set, instances without any IP address, such as terminated
+        ones still listed under a reused name, are left out'''
+
+        query = query.lower()
+
+        exact = self._rows_for_keys([query], reachable)
+        if exact:
+            return exact
+
+        return self._rows_for_keys(self.complete(query), reachable)
+
+    def search(self, query, limit=20):
+        '''Returns the instance rows matching a query. Exact key matches win,
+        then prefix matches, then substring and fuzzy matches on names'''
+
+        matches = self.match(query)
+        if matches:
+            return matches[:limit]
+
+        query = query.lower()
+
+        names = [row[1] for row in self.rows if row[1]]
+        candidates = [x for x in names if query in x]
+        candidates += difflib.get_close_matches(query, _trigram_candidates(query, names), n=limit, cutoff=CONST_SEARCH_FUZZY_CUTOFF)
+        return self._rows_for_keys(candidates)[:limit]
+
+    def _rows_for_keys(self, keys, reachable=False):
+        seen = set()
+        rows = []
+
+        for key in keys:
+            n = bisect.bisect_left(self.keys, key)
+            while n < len(self.keys) and self.keys[n] == key:
+                if self.slots[n] not in seen:
+                    seen.add(self.slots[n])
+                    row = self.rows[self.slots[n]]
+                    if not reachable or row[2] or row[3]:
+                        rows.append(row)
+                n += 1
+
+        return rows
+
+
+###############################################################################
+# Functions
+###############################################################################
+
+
+def _trigram_candidates(query, names, limit=CONST_SEARCH_FUZZY_CANDIDATES):
+    '''Returns the names sharing the most trigrams with the query so that only
+    a few of them need a full difflib comparison'''
+
+    trigrams = set(query[n:n + 3] for n in range(max(1, len(query) - 2)))
+    scored = []
+
+    for name in names:
+        score = sum(1 for t in trigrams if t in name)
+        if score * 2 >= len(trigrams):
+            scored.append((score, name))
+
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [name for _, name in scored[:limit]]
+
+
+def get_instance_search_index(refresh=False, ttl=CONST_SEARCH_CACHE_TTL):
+    '''Returns the instance search index for the current account and region,
+    loading the persisted copy where possible and otherwise building it from
+    the resource mapper'''
+
+    region = os.getenv('AWS_DEFAULT_REGION')
+    account_id = os.getenv('AWS_ACCOUNT_NUMBER')
+
+    store = None
+    if account_id and region:
+        store = SnapshotStore('search', account_id, region, ttl=ttl)
+        if not refresh:
+            index = InstanceSearchIndex.from_snapshot(store.load('instance') or {})
+            if index is not None:
+                _log.debug('Loaded search index of {0} instances'.format(len(index)))
+                return index
+
+    # Only pay for the boto imports when the index has to be rebuilt
+    from awshutils.aws.mapper import AwsResourceMapper
+
+    mapper = AwsResourceMapper()
+    if refresh:
+        mapper.invalidate_cache('instance')
+
+    index = InstanceSearchIndex.from_index(mapper.get_index('instance'))
+    _log.debug('Built search index of {0} instances'.format(len(index)))
+
+    if store is not None:
+        store.save('instance', index.to_snapshot())
+
+    return index
+
+
+def search_instances(query, limit=20):
+    '''Searches the instance index, rebuilding a persisted index once if it
+    has no match in case the instance was launched since it was saved'''
+
+    index = get_instance_search_index()
+    rows = index.search(query, limit=limit)
+    if not rows and index.cached:
+        _log.debug('No match for {0} in persisted index. Rebuilding'.format(query))
+        rows = get_instance_search_index(refresh=True).search(query, limit=limit)
+
+    return rows
+
+
+def resolve_instance(query):
+    '''Returns the instance rows a connection target may refer to: exact id,
+    name or IP matches, or else prefix matches. Substring and fuzzy matches
+    are never returned so a typo cannot select another host, and instances
+    without an IP address to connect to are skipped. A persisted index
+    without such a match is rebuilt once in case it is out of date'''
+
+    index = get_instance_search_index()
+    rows = index.match(query, reachable=True)
+    if not rows and index.cached:
+        _log.debug('No exact or prefix match for {0} in persisted index. Rebuilding'.format(query))
+        rows = get_instance_search_index(refresh=True).match(query, reachable=True)
+
+    return rows
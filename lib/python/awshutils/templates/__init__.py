@@ -0,0 +1,76 @@
+# Header will go here when ready to publish
+"""
+Shared Jinja2 template environments for AWSH tools. Compiled templates are
+kept in an on-disk bytecode cache so repeated runs skip template compilation
+"""
+
+import os
+import logging
+import threading
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+from awshutils.logger import LOG_CONTEXT
+from awshutils.aws.cache import CONST_CACHE_ROOT
+
+###############################################################################
+# CONFIG - Begin
+###############################################################################
+
+CONST_TEMPLATE_CACHE_DIR = os.getenv(
+    'AWSH_TEMPLATE_CACHE_DIR',
+    os.path.join(CONST_CACHE_ROOT, 'jinja2')
+)
+
+###############################################################################
+# CONFIG - End (Do Not Edit Below)
+###############################################################################
+
+_log = logging.getLogger(LOG_CONTEXT)
+
+_environments = {}
+_environments_lock = threading.Lock()
+
+###############################################################################
+# Functions
+###############################################################################
+
+
+def get_bytecode_cache(directory=CONST_TEMPLATE_CACHE_DIR):
+    '''Returns the on-disk bytecode cache shared by all environments, or None
+    if the cache directory cannot be created'''
+
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError as e:
+        _log.warning('Template bytecode cache disabled. Unable to create {0}: {1}'.format(directory, e))
+        return None
+
+    return FileSystemBytecodeCache(directory)
+
+
+def get_environment(template_dir, filters=None, trim_blocks=True):
+    '''Returns the process-wide Jinja2 environment for a template directory,
+    creating it on first use. Custom filters are registered once per
+    environment. Templates whose source has not changed are loaded from the
+    bytecode cache instead of being compiled again
+    eg.
+        get_environment('/opt/awsh/etc/visual.d/templates/dot', filters={'gv_safe_id': gv_safe_id})
+    '''
+
+    key = (os.path.abspath(template_dir), trim_blocks)
+
+    with _environments_lock:
+        env = _environments.get(key)
+        if env is None:
+            _log.debug('Creating template environment for {0}'.format(key[0]))
+            env = Environment(
+                loader=FileSystemLoader(template_dir),
+                trim_blocks=trim_blocks,
+                bytecode_cache=get_bytecode_cache()
+            )
+            _environments[key] = env
+
+        for name, fn in (filters or {}).items():
+            if env.filters.get(name) is not fn:
+                env.filters[name] = fn
+
+    return env
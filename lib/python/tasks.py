@@ -50,3 +50,58 @@ def support(c):
             zip.write(os.path.join(tempdir, "versions.txt"), "versions.txt")
 
         print(f"Support file created at {zipfilename}")
+
+
+@task(help={"count": "Number of synthetic EC2 instances to index"})
+def bench_mapper_memory(c, count=50000):
+    """Compare the memory held by the mapper's old per-type LUT dicts with the
+    compact ResourceIndex for the same set of instances"""
+    import tracemalloc
+    from boto.ec2.instance import Instance
+    from awshutils.aws.index import ResourceIndex, ResourceRecord
+
+    count = int(count)
+
+    def instances():
+        for n in range(count):
+            i = Instance()
+            i.id = f"i-{n:017x}"
+            i.tags = {"Name": f"host-{n:06d}.example.internal", "Environment": "bench", "Owner": "awsh"}
+            i.vpc_id = f"vpc-{n % 40:017x}"
+            i.subnet_id = f"subnet-{n % 400:017x}"
+            i.private_ip_address = f"10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}"
+            i.ip_address = f"52.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}" if n % 3 == 0 else None
+            i.private_dns_name = f"ip-{i.private_ip_address.replace('.', '-')}.ec2.internal"
+            i.instance_type = "t3.micro"
+            i.image_id = "ami-0123456789abcdef0"
+            i.launch_time = "2024-01-01T00:00:00.000Z"
+            yield i
+
+    def measure(build):
+        tracemalloc.start()
+        held = build()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del held
+        return current, peak
+
+    def build_luts():
+        names_to_ids, names_to_instances, ids_to_names, ids_to_instances = {}, {}, {}, {}
+        for i in instances():
+            name = i.tags["Name"].lower()
+            names_to_ids[name] = i.id
+            names_to_instances[name] = i
+            ids_to_names[i.id] = name
+            ids_to_instances[i.id] = i
+        return names_to_ids, names_to_instances, ids_to_names, ids_to_instances
+
+    def build_index():
+        index = ResourceIndex("instance", secondary=("name", "private_ip", "public_ip"), complete=True)
+        for i in instances():
+            index.add(ResourceRecord.from_resource(i, i.tags["Name"].lower()))
+        return index
+
+    print(f"Indexing {count} synthetic instances")
+    for label, build in [("LUT dicts + boto objects", build_luts), ("ResourceIndex", build_index)]:
+        current, peak = measure(build)
+        print(f"{label:<26} held: {current / 1048576:8.1f} MiB  peak: {peak / 1048576:8.1f} MiB")